@@ -2,6 +2,9 @@
 # --------------------------------------
 # Flask implementation.
 
+from time import perf_counter, sleep
+STARTUP_START = perf_counter() # Measure import time (see also: python -X importtime app.py)
+
 from flask import Flask, render_template, request, jsonify, session
 from utilities import get_unique_uid
 from censored_words import wordset
@@ -12,17 +15,18 @@ import redis
 
 import bleach
 import random
-import tempfile
-from time import perf_counter, sleep
+import re
+import gc
 import os
 
-from langchain.document_loaders import TextLoader
-from langchain.chat_models import ChatOpenAI
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-
-from shell import retrieve_yelp_info, format_business_data, run_query, merge_queries
+from embedding_backends import get_embeddings
+from numpy_store import get_vectorstore_cls
+from context_packing import build_qa_chain, count_tokens
+from index_store import load_business, store_business
+from fast_path import answer_structured
+from model_router import chat_llm, run_routed
+from chat_history import append_turn, get_history, clear_history
+from shell import retrieve_yelp_info, search_yelp_business, run_query, merge_queries, run_unified_query, INFO_PREAMBLE, REVIEW_PREAMBLE, ANSWER_MODE
 
 app = Flask(__name__)
 
@@ -51,6 +55,9 @@ else:
     app.config['SESSION_REDIS'] = redis.StrictRedis(host='127.0.0.1', port=6379, db=0)
     Session(app)
 
+# Persisted business data and indexes share the session Redis
+index_redis = app.config['SESSION_REDIS']
+
 AI_REPLIES = [
     "Sorry, the location should contain at least 1 character and at most 250 characters.",
     "Uh-oh! The length of the location you provided doesn't meet the required range (1-250 characters).",
@@ -73,6 +80,8 @@ SAMPLE_LINKS = [
     "https://www.yelp.com/biz/breakfast-republic-irvine-2",
     "https://www.yelp.com/biz/daves-hot-chicken-irvine-2"
 ]
+# Every censored word in one alternation, compiled once and shared by all workers
+CENSOR_PATTERN = re.compile('|'.join(re.escape(word) for word in sorted(wordset, key=len, reverse=True)) or r'(?!)')
 STARS = {
     '0.0': ".././static/images/stars/0.png",
     '0.5': ".././static/images/stars/0.png",
@@ -91,7 +100,6 @@ STARS = {
 @app.route("/", methods=["GET", "POST"])
 def index():
     global DEBUGGING, PRODUCTION, AI_REPLIES, SAMPLE_LINKS, STARS
-    chat_history = []
 
     # PRODUCTION (2/7): Rate limiting
     if PRODUCTION:
@@ -132,51 +140,40 @@ def index():
                 initial_response = None
 
                 if not DEBUGGING:             
-                    business_data = retrieve_yelp_info(name, location, web_app=True)
+                    # Reuse data and indexes persisted by an earlier chat or by warmup.py
+                    cached = None
+                    business = search_yelp_business(name, location)
+                    alias = business["alias"] if business else None
+                    if alias:
+                        try:
+                            cached = load_business(index_redis, alias)
+                        except Exception as e:
+                            print("ERROR LOADING CACHED BUSINESS", e)
 
-                    for section in business_data:
-                        if business_data[section]:
-                            break
+                    if cached:
+                        print("LOADED CACHED BUSINESS:", alias)
+                        business_data, info_db, review_db = cached
                     else:
-                        return render_template("index.html", error_message="It seems that we could not find a Yelp business which matched your query. Please double-check and try again.", sample_link=SAMPLE_LINKS[random.randint(0, len(SAMPLE_LINKS)-1)])
-                    
-                    business_info, business_reviews = format_business_data(business_data, web_app=True)
-                    info_temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False)
-                    review_temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False)
-                    with info_temp_file as f:
-                        f.write(business_info)
-                        # DEBUGGING PURPOSES: See what data the chatbot is trained on
-                        # with open("webapp_data_info.txt", 'w') as f:
-                        #     f.write(business_info)
-
-                    with review_temp_file as f:
-                        f.write(business_reviews)
-                        # DEBUGGING PURPOSES: See what data the chatbot is trained on
-                        # with open("webapp_data_rev.txt", 'w') as f:
-                        #     f.write(business_reviews)
+                        business_data = retrieve_yelp_info(name, location, web_app=True, business=business)
+
+                        for section in business_data:
+                            if business_data[section]:
+                                break
+                        else:
+                            return render_template("index.html", error_message="It seems that we could not find a Yelp business which matched your query. Please double-check and try again.", sample_link=SAMPLE_LINKS[random.randint(0, len(SAMPLE_LINKS)-1)])
 
                     try:
-                        # Initiate FAISS indexes to utilize for querying
-                        info_path = info_temp_file.name
-                        review_path = review_temp_file.name
-                        info_loader = TextLoader(info_path)
-                        review_loader = TextLoader(review_path)
-                        info_docs = info_loader.load_and_split()
-                        review_docs = review_loader.load_and_split()
-                        info_db = FAISS.from_documents(info_docs, embedding=OpenAIEmbeddings())
-                        review_db = FAISS.from_documents(review_docs, embedding=OpenAIEmbeddings())
+                        if not cached:
+                            # Initiate vector indexes to utilize for querying
+                            # (reviews are indexed one per review so a refresh only embeds the new ones)
+                            _, info_db, review_db = store_business(index_redis, business_data)
 
                         print("STORING INFO_DB IN SESSION")
                         session['info_db'] = info_db.serialize_to_bytes()
                         print("STORING REVIEW_DB IN SESSION")
                         session['review_db'] = review_db.serialize_to_bytes()
-
-                        try:
-                            print("TRYING TO CLEAN UP TEMPFILES")
-                            os.remove(info_path)
-                            os.remove(review_path)
-                        except Exception as e:
-                            print("ERROR TRYING TO CLEAN UP TEMPFILES", e)
+                        session['business_data'] = dict(business_data)
+                        clear_history(index_redis, history_id(uid))
 
                     except Exception as e:
                         initial_response = "Notice: Data retrieval has failed. Please return to the homepage by clicking the top left logo and try again. ❌"
@@ -225,6 +222,7 @@ def index():
         # Handle chatbot queries
         else:
             query = request.form.get("query")
+            final = False # Reply answers the question without the review/merge steps
 
             # Prevent spam queries
             if len(query) <= 200:
@@ -232,12 +230,12 @@ def index():
                 # Query our vector index after sanitizing
                 query = bleach.clean(query, tags=[], attributes={}, strip=True)
 
-                for word in wordset:
-                    if word in query.lower():
-                        query = '*' * len(query)
-                        session[f"{uid}_cur"] = 0
-                        chatbot_reply = f"Notice: Your message \"{word[0]}{'*'*(len(word)-1)}\" has been flagged. ❌"
-                        break
+                censored = CENSOR_PATTERN.search(query.lower())
+                if censored:
+                    word = censored.group(0)
+                    query = '*' * len(query)
+                    session[f"{uid}_cur"] = 0
+                    chatbot_reply = f"Notice: Your message \"{word[0]}{'*'*(len(word)-1)}\" has been flagged. ❌"
                 else:
                     if not DEBUGGING:
                         chatbot_reply = None
@@ -245,6 +243,12 @@ def index():
                         # Try to get databases from session
                         info_db = session.get('info_db')
                         review_db = session.get('review_db')
+
+                        # Answer factual questions (hours, phone, price, ...) straight from the Yelp data
+                        fast_reply = None
+                        if not session.get(f"{uid}_cur") and session.get('business_data'):
+                            fast_reply = answer_structured(query, session['business_data'])
+
                         if not info_db or not review_db:
                             session[f"{uid}_cur"] = 0
                             chatbot_reply = "Notice: Chatbot data has failed to load, the chat may have reached its 10 minute time limit. Please return to the homepage and try again. To read why this time limit is in place, read via the popup on the homepage. ❌"
@@ -252,9 +256,12 @@ def index():
                                 print("INFO_DB NOT FOUND IN SESSION")
                             if not review_db:
                                 print("REVIEW_DB NOT FOUND IN SESSION")
+                        elif fast_reply:
+                            chatbot_reply = fast_reply
+                            final = True
                         else:                            
                             # uid_cur = Current message to send
-                            # - 1: Send information message
+                            # - 1: Send information message (or the whole answer when ANSWER_MODE is "unified")
                             # - 2: Send review message
                             # - 3: Send merged
                             cur_msg = session.get(f"{uid}_cur")
@@ -278,14 +285,24 @@ def index():
                                         return handle_rate_limit_error()
                                 
                                 try:
-                                    # Create FAISS database
-                                    info_db = FAISS.deserialize_from_bytes(embeddings=OpenAIEmbeddings(), serialized=info_db)
+                                    # Create vector index
+                                    info_db = get_vectorstore_cls().deserialize_from_bytes(embeddings=get_embeddings(), serialized=info_db)
+
+                                    # Unified mode: a single LLM call over both indexes answers the whole query
+                                    if ANSWER_MODE == "unified":
+                                        review_db = get_vectorstore_cls().deserialize_from_bytes(embeddings=get_embeddings(), serialized=review_db)
+                                        history = get_history(index_redis, history_id(uid))
+                                        chatbot_reply = run_unified_query(info_db, review_db, query, history)
+                                        session[f"{uid}_cur"] = 0
+                                        final = True
 
                                     # Query using LangChain's RetrievalQA
-                                    info_qa = RetrievalQA.from_chain_type(llm=ChatOpenAI(temperature=0, model="gpt-4"), chain_type="stuff", retriever=info_db.as_retriever())
-                                    res_1 = run_query(info_qa, query)
-                                    session[f"{uid}_res_1"] = res_1
-                                    chatbot_reply = f"Based on Yelp's information:\n{res_1}"
+                                    else:
+                                        history = get_history(index_redis, history_id(uid))
+                                        info_qa = lambda model: run_query(build_qa_chain(chat_llm(model), info_db, INFO_PREAMBLE, history), query)
+                                        res_1 = run_routed(info_qa, query, "info")
+                                        session[f"{uid}_res_1"] = res_1
+                                        chatbot_reply = f"Based on Yelp's information:\n{res_1}"
                                 except Exception as e:
                                     session[f"{uid}_cur"] = 0
                                     chatbot_reply = "Notice: Chatbot has failed to query, the chat may have reached its 10 minute time limit. Please return to the homepage and try again. To read why this time limit is in place, read via the popup on the homepage. ❌"
@@ -294,12 +311,13 @@ def index():
                             # If we have not searched the review database yet
                             elif session.get(f"{uid}_cur") == 2:
                                 try:
-                                    # Create FAISS database
-                                    review_db = FAISS.deserialize_from_bytes(embeddings=OpenAIEmbeddings(), serialized=review_db)
+                                    # Create vector index
+                                    review_db = get_vectorstore_cls().deserialize_from_bytes(embeddings=get_embeddings(), serialized=review_db)
 
                                     # Query using LangChain's RetrievalQA
-                                    review_qa = RetrievalQA.from_chain_type(llm=ChatOpenAI(temperature=0, model="gpt-4"), chain_type="stuff", retriever=review_db.as_retriever())
-                                    res_2 = run_query(review_qa, query)
+                                    history = get_history(index_redis, history_id(uid))
+                                    review_qa = lambda model: run_query(build_qa_chain(chat_llm(model), review_db, REVIEW_PREAMBLE, history), query)
+                                    res_2 = run_routed(review_qa, query, "reviews")
                                     session[f"{uid}_res_2"] = res_2
                                     chatbot_reply = f"Based on Yelp's reviews:\n{res_2}"
                                 except Exception as e:
@@ -315,6 +333,7 @@ def index():
                                 session.pop(f"{uid}_res_1")
                                 session.pop(f"{uid}_res_2")
                                 session[f"{uid}_cur"] = 0
+                                final = True
                             
                             else:
                                 chatbot_reply = "Notice: An unknown error has occurred while trying to answer your query. Please try again or restart the chat. ❌"
@@ -330,11 +349,10 @@ def index():
                 session[f"{uid}_cur"] = 0
                 chatbot_reply = f"Notice: Sorry! Your message ({len(query)} characters) is too long. The maximum is 200 characters."
 
-            # Append sanitized query and chatbot reply, return to React
-            chat_history = request.form.getlist("chat_history[]")
-            chat_history.append("USR" + query)
-            chat_history.append("BOT" + chatbot_reply)
-            return jsonify({"sanitized_user_query": query, "chat_history": chat_history, "chatbot_reply": chatbot_reply})
+            # Keep the conversation server-side (for follow-ups), only the new reply is sent back to React
+            if final and not chatbot_reply.startswith("Notice:"):
+                append_turn(index_redis, history_id(uid), query, chatbot_reply)
+            return jsonify({"sanitized_user_query": query, "chatbot_reply": chatbot_reply, "final": final})
     
     print("CLEANING UP SESSION")
     try:
@@ -342,12 +360,15 @@ def index():
             session.pop('info_db')
         if session.get('review_db'):
             session.pop('review_db')
+        if session.get('business_data'):
+            session.pop('business_data')
         if session.get(f"{uid}_cur"):
             session.pop(f"{uid}_cur")
         if session.get(f"{uid}_res_1"):
             session.pop(f"{uid}_res_1")
         if session.get(f"{uid}_res_2"):
             session.pop(f"{uid}_res_2")
+        clear_history(index_redis, history_id(uid))
         
         # PRODUCTION (6/7): Uncomment this for deployment, keep commented if testing locally
         if PRODUCTION:    
@@ -387,15 +408,10 @@ def handle_rate_limit_error():
             if len(query) <= 200:
                 query = bleach.clean(query, tags=[], attributes={}, strip=True)
 
-                for word in wordset:
-                    if word in query.lower():
-                        query = '*' * len(query)
-                        break
+                if CENSOR_PATTERN.search(query.lower()):
+                    query = '*' * len(query)
 
-            chat_history = request.form.getlist("chat_history[]")
-            chat_history.append("USR" + query)
-            chat_history.append("BOT" + error_message)
-            return jsonify({"sanitized_user_query": query, "chat_history": chat_history, "chatbot_reply": error_message})
+            return jsonify({"sanitized_user_query": query, "chatbot_reply": error_message, "final": False})
 
     print("RATE LIMIT EXCEEDED IN POPUP")
     return render_template("index.html", error_message=error_message, sample_link=random.choice(SAMPLE_LINKS))
@@ -412,6 +428,9 @@ def cleanup():
             session.pop('info_db')
         if session.get('review_db'):
             session.pop('review_db')
+        if session.get('business_data'):
+            session.pop('business_data')
+        clear_history(index_redis, history_id("DEV" if not PRODUCTION else get_unique_uid(request)))
         
         # PRODUCTION (7/7): Uncomment this for deployment, keep commented if testing locally
         if PRODUCTION:
@@ -429,6 +448,13 @@ def cleanup():
     return "SUCCESS"
 
 
+def history_id(uid: str) -> str:
+    """
+    Key of the server-side chat history: the Flask-Session id, or the uid without one.
+    """
+    return getattr(session, "sid", None) or uid
+
+
 def craft_initial_response(business_data: dict) -> str:
     """
     Present a string which shows what data has been retrieved from the Yelp retrieval.
@@ -458,6 +484,19 @@ def craft_initial_response(business_data: dict) -> str:
     return res[:-2]+" ✅" if found else "Notice: Data retrieval has failed. Please return to the homepage by clicking the top left logo and try again. ❌"
 
 
+# Load the GPT-4 tokenizer in the master too, so workers share it instead of each loading (or downloading) it;
+# without network access it is loaded on first use instead
+try:
+    count_tokens("")
+except Exception as e:
+    print("TOKENIZER NOT PRELOADED:", repr(e))
+
+# Everything above is loaded once in the gunicorn master (--preload); freeze it so the
+# garbage collector does not touch (and copy) those pages in the forked workers
+gc.freeze()
+print(f"STARTUP: app loaded in {perf_counter()-STARTUP_START:.2f} seconds")
+
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)
 
@@ -0,0 +1,42 @@
+# chat_history.py - Julian Zulfikar
+# --------------------------------------
+# Bounded, compacted per-session chat history kept server-side in Redis.
+
+import os
+import json
+
+HISTORY_KEY_PREFIX = "quickyelp:history:"
+HISTORY_TTL = int(os.environ.get("HISTORY_TTL", 60*10)) # Same 10 minute limit as the chat session
+HISTORY_MAX_TURNS = int(os.environ.get("HISTORY_MAX_TURNS", 6))
+HISTORY_MAX_CHARS = int(os.environ.get("HISTORY_MAX_CHARS", 400)) # Per stored message
+
+
+def compact(message: str) -> str:
+    """
+    Collapse whitespace and cut long messages down to HISTORY_MAX_CHARS.
+    """
+    message = " ".join(message.split())
+    return message if len(message) <= HISTORY_MAX_CHARS else message[:HISTORY_MAX_CHARS-3]+"..."
+
+
+def append_turn(redis_client, session_id: str, query: str, reply: str):
+    """
+    Store one (query, reply) turn, keeping only the last HISTORY_MAX_TURNS.
+    """
+    key = HISTORY_KEY_PREFIX+session_id
+    pipe = redis_client.pipeline()
+    pipe.rpush(key, json.dumps([compact(query), compact(reply)]))
+    pipe.ltrim(key, -HISTORY_MAX_TURNS, -1)
+    pipe.expire(key, HISTORY_TTL)
+    pipe.execute()
+
+
+def get_history(redis_client, session_id: str) -> list:
+    """
+    Previous (query, reply) turns of this session, oldest first.
+    """
+    return [tuple(json.loads(turn)) for turn in redis_client.lrange(HISTORY_KEY_PREFIX+session_id, 0, -1)]
+
+
+def clear_history(redis_client, session_id: str):
+    redis_client.delete(HISTORY_KEY_PREFIX+session_id)
@@ -0,0 +1,134 @@
+# context_packing.py - Julian Zulfikar
+# --------------------------------------
+# Token-budgeted context packing for the RetrievalQA "stuff" chains.
+
+import os
+from typing import List, Tuple
+
+import tiktoken
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.chains import RetrievalQA
+from langchain.docstore.document import Document
+from langchain.prompts.chat import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+from langchain.schema import AIMessage, HumanMessage
+from langchain.schema.retriever import BaseRetriever
+from langchain.vectorstores.base import VectorStore
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+RELEVANCE_THRESHOLD = float(os.environ.get("RELEVANCE_THRESHOLD", 0.25))
+RETRIEVAL_FETCH_K = int(os.environ.get("RETRIEVAL_FETCH_K", 8))
+MIN_CHUNK_TOKENS = 64
+
+SYSTEM_TEMPLATE = "{preamble}\n" + \
+    "Use the following pieces of context to answer the users question. \n" + \
+    "If you don't know the answer, just say that you don't know, don't try to make up an answer.\n" + \
+    "----------------\n{context}"
+
+_encoding = None
+
+
+def _get_encoding():
+    """
+    GPT-4 tokenizer, loaded on first use (tiktoken may need to download it).
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.encoding_for_model("gpt-4")
+    return _encoding
+
+
+def _encode(text: str) -> list:
+    # Special-token strings such as "<|endoftext|>" in reviews/queries are plain text here
+    return _get_encoding().encode(text, disallowed_special=())
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of GPT-4 tokens in text.
+    """
+    return len(_encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text down to at most max_tokens GPT-4 tokens.
+    """
+    return _get_encoding().decode(_encode(text)[:max_tokens])
+
+
+def pack_documents(scored_docs: List[Tuple[Document, float]], budget: int) -> Tuple[List[Document], int]:
+    """
+    Greedily fit the most relevant documents into the token budget.
+        Returns the packed documents and the number of tokens they use.
+    """
+    packed, used = [], 0
+    for doc, _ in sorted(scored_docs, key=lambda pair: pair[1], reverse=True):
+        remaining = budget - used
+        tokens = count_tokens(doc.page_content)
+        if tokens <= remaining:
+            packed.append(doc)
+            used += tokens
+        elif remaining >= MIN_CHUNK_TOKENS:
+            # Keep the head of a large chunk rather than dropping it entirely
+            packed.append(Document(page_content=truncate_tokens(doc.page_content, remaining), metadata=doc.metadata))
+            used += remaining
+        if budget - used < MIN_CHUNK_TOKENS:
+            break
+    return packed, used
+
+
+def retrieve_packed(vectorstore: VectorStore, query: str, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                    score_threshold: float = RELEVANCE_THRESHOLD, fetch_k: int = RETRIEVAL_FETCH_K):
+    """
+    Chunks relevant to the query, packed into the token budget.
+        Returns (documents, context tokens, number of chunks fetched).
+    """
+    scored_docs = vectorstore.similarity_search_with_relevance_scores(query, k=fetch_k)
+    relevant = [(doc, score) for doc, score in scored_docs if score >= score_threshold]
+    packed, context_tokens = pack_documents(relevant, token_budget)
+    return packed, context_tokens, len(scored_docs)
+
+
+class PackedRetriever(BaseRetriever):
+    """
+    Retriever which drops chunks below a relevance threshold and packs the rest into a token budget.
+    """
+    vectorstore: VectorStore
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    score_threshold: float = RELEVANCE_THRESHOLD
+    fetch_k: int = RETRIEVAL_FETCH_K
+    retrieval_prefix: str = ""
+    prompt_overhead_tokens: int = 0
+    last_prompt_tokens: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        retrieval_query = f"{self.retrieval_prefix} {query}" if self.retrieval_prefix else query
+        packed, context_tokens, fetched = retrieve_packed(self.vectorstore, retrieval_query, self.token_budget, self.score_threshold, self.fetch_k)
+
+        self.last_prompt_tokens = self.prompt_overhead_tokens + count_tokens(query) + context_tokens
+        print(f"PROMPT TOKENS: {self.last_prompt_tokens} (CONTEXT {context_tokens}, {len(packed)}/{fetched} CHUNKS)")
+        return packed
+
+
+def build_qa_chain(llm, vectorstore: VectorStore, preamble: str = "", history: list = None, **retriever_kwargs) -> RetrievalQA:
+    """
+    RetrievalQA "stuff" chain over a packed retriever; the preamble is sent once in the system prompt.
+        history is a list of previous (query, reply) turns: they are sent before the question,
+        and follow-ups retrieve alongside the previous question.
+    """
+    history = history or []
+    turns = []
+    for previous_query, previous_reply in history:
+        turns += [HumanMessage(content=previous_query), AIMessage(content=previous_reply)]
+    prompt = ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(SYSTEM_TEMPLATE.replace("{preamble}", preamble.replace("{", "{{").replace("}", "}}"))),
+        *turns,
+        HumanMessagePromptTemplate.from_template("{question}")
+    ])
+    retriever = PackedRetriever(vectorstore=vectorstore, retrieval_prefix=history[-1][0] if history else "", **retriever_kwargs)
+    retriever.prompt_overhead_tokens = count_tokens(SYSTEM_TEMPLATE.format(preamble=preamble, context="")) + \
+        sum(count_tokens(message.content) for message in turns)
+    return RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, chain_type_kwargs={"prompt": prompt})
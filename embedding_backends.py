@@ -0,0 +1,163 @@
+# embedding_backends.py - Julian Zulfikar
+# --------------------------------------
+# Pluggable embedding backends: OpenAI (remote) or a local ONNX model (CPU).
+
+import os
+import threading
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+from embedding_dispatcher import BatchingEmbeddings, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH_INPUTS
+
+# Selected per deployment: "openai" (default) or "local"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai").lower()
+LOCAL_EMBEDDING_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+OPENAI_EMBEDDING_MODEL = os.environ.get("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", os.cpu_count() or 1))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_MAX_LENGTH = int(os.environ.get("EMBEDDING_MAX_LENGTH", 256))
+
+_local_embeddings = None
+_batching_embeddings = None
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed locally on CPU via onnxruntime.
+        Vectors are mean pooled over tokens and L2 normalized.
+        The model bytes are loaded once (shared by forked workers), the onnxruntime session
+        is created lazily in each process since its thread pool does not survive a fork.
+    """
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, threads: int = EMBEDDING_THREADS,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_length: int = EMBEDDING_MAX_LENGTH):
+        import numpy as np
+        from tokenizers import Tokenizer
+        from huggingface_hub import hf_hub_download
+
+        self.np = np
+        self.batch_size = max(1, batch_size)
+        self.threads = max(1, threads)
+
+        print("LOADING LOCAL EMBEDDING MODEL:", model_name)
+        model_path = hf_hub_download(model_name, "onnx/model.onnx")
+        tokenizer_path = hf_hub_download(model_name, "tokenizer.json")
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_token = "[PAD]" if self.tokenizer.token_to_id("[PAD]") is not None else "<pad>"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+        with open(model_path, 'rb') as f:
+            self.model_bytes = f.read()
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        print("LOCAL EMBEDDING MODEL LOADED")
+
+    @property
+    def session(self):
+        """
+        onnxruntime session for the current process, created once even with concurrent first calls.
+        """
+        if self._session is not None and self._session_pid == os.getpid():
+            return self._session
+        with self._session_lock:
+            if self._session is None or self._session_pid != os.getpid():
+                import onnxruntime as ort
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session = ort.InferenceSession(self.model_bytes, sess_options=options, providers=["CPUExecutionProvider"])
+                # Publish input_names, then the session, then the pid the unlocked check above relies on
+                self.input_names = {model_input.name for model_input in session.get_inputs()}
+                self._session = session
+                self._session_pid = os.getpid()
+            return self._session
+
+    def _embed_batch(self, texts: List[str]):
+        """
+        Embed a single batch of texts, returns a (len(texts), dim) float32 matrix.
+        """
+        np = self.np
+        session = self.session
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        inputs = {name: value for name, value in inputs.items() if name in self.input_names}
+
+        token_embeddings = session.run(None, inputs)[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a list of documents in batches of batch_size.
+        """
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(texts[i:i+self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query.
+        """
+        return self._embed_batch([text])[0].tolist()
+
+
+def _base_embeddings() -> Embeddings:
+    """
+    The configured backend itself, without batching.
+        The local model is only loaded once per process.
+    """
+    global _local_embeddings
+
+    if EMBEDDING_BACKEND == "local":
+        if _local_embeddings is None:
+            _local_embeddings = LocalEmbeddings()
+        return _local_embeddings
+    elif EMBEDDING_BACKEND == "openai":
+        from langchain.embeddings import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL, chunk_size=EMBEDDING_MAX_BATCH_INPUTS)
+    else:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+
+
+def embedding_id() -> str:
+    """
+    Backend and model the vectors come from, e.g. "openai/text-embedding-ada-002".
+        Vectors from different backends/models are not comparable (or even the same size).
+    """
+    model = LOCAL_EMBEDDING_MODEL if EMBEDDING_BACKEND == "local" else OPENAI_EMBEDDING_MODEL
+    return f"{EMBEDDING_BACKEND}/{model}"
+
+
+def get_embeddings() -> Embeddings:
+    """
+    Return the embedding backend configured for this deployment.
+        Unless EMBEDDING_BATCH_WINDOW_MS is 0, calls from concurrent chats share one
+        BatchingEmbeddings dispatcher and are sent to the backend in batches.
+    """
+    global _batching_embeddings
+
+    if EMBEDDING_BATCH_WINDOW_MS <= 0:
+        return _base_embeddings()
+    if _batching_embeddings is None:
+        # OpenAI limits tokens per request (counted with its tokenizer), the local model is only bounded by CPU
+        count_tokens = None
+        if EMBEDDING_BACKEND == "openai":
+            from context_packing import count_tokens
+        _batching_embeddings = BatchingEmbeddings(_base_embeddings(), count_tokens=count_tokens)
+    return _batching_embeddings
+
+
+# Load the local model at process start rather than on the first chat
+if EMBEDDING_BACKEND == "local":
+    get_embeddings()
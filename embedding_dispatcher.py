@@ -0,0 +1,156 @@
+# embedding_dispatcher.py - Julian Zulfikar
+# --------------------------------------
+# Coalesces embedding calls from concurrent chats into batched provider requests.
+
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+
+EMBEDDING_BATCH_WINDOW_MS = float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", 20)) # 0 disables batching
+EMBEDDING_MAX_BATCH_INPUTS = int(os.environ.get("EMBEDDING_MAX_BATCH_INPUTS", 2048)) # OpenAI inputs per request
+EMBEDDING_MAX_BATCH_TOKENS = int(os.environ.get("EMBEDDING_MAX_BATCH_TOKENS", 250000)) # OpenAI tokens per request
+EMBEDDING_DISPATCH_THREADS = int(os.environ.get("EMBEDDING_DISPATCH_THREADS", 4))
+EMBEDDING_TIMEOUT = float(os.environ.get("EMBEDDING_TIMEOUT", 60)) # Seconds a caller waits for its batch
+
+
+def plan_batches(items: list, max_inputs: int, max_tokens: int) -> list:
+    """
+    Split (caller, index, text, tokens) items into batches within the input and token limits.
+        Items keep their order; a single oversized text still gets a batch of its own.
+        max_tokens=None means the backend has no per-request token limit.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for item in items:
+        tokens = item[3]
+        if batch and (len(batch) >= max_inputs or (max_tokens is not None and batch_tokens+tokens > max_tokens)):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper which collects texts from concurrent callers (index builds and queries)
+    for a short window and sends them to the wrapped backend as one batched request.
+        The vectors are fanned back out to each caller in order.
+        The dispatcher thread is started lazily in each process, since threads do not survive a fork.
+        count_tokens is the backend's tokenizer; without one (e.g. the local model) only max_inputs applies.
+    """
+    def __init__(self, base: Embeddings, window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_inputs: int = EMBEDDING_MAX_BATCH_INPUTS, max_tokens: int = EMBEDDING_MAX_BATCH_TOKENS,
+                 threads: int = EMBEDDING_DISPATCH_THREADS, count_tokens=None):
+        self.base = base
+        self.window = max(0.0, window_ms) / 1000
+        self.max_inputs = max(1, max_inputs)
+        self.max_tokens = max(1, max_tokens) if count_tokens else None
+        self.count_tokens = count_tokens
+        self.threads = max(1, threads)
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        """
+        Start the collecting thread (and the pool sending batches) for the current process.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pool = ThreadPoolExecutor(max_workers=self.threads)
+            threading.Thread(target=self._collect, daemon=True, name="embedding-dispatcher").start()
+            self._pid = os.getpid()
+
+    def _collect(self):
+        """
+        Gather requests for up to one window after the first arrives, then hand them off as a group.
+            A request which would take the group past max_inputs starts the next window instead.
+        """
+        carry = None
+        while True:
+            pending = [carry if carry is not None else self._queue.get()]
+            carry = None
+            inputs = len(pending[0][0])
+            deadline = perf_counter() + self.window
+            while inputs < self.max_inputs:
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if inputs + len(request[0]) > self.max_inputs:
+                    carry = request
+                    break
+                pending.append(request)
+                inputs += len(request[0])
+            self._pool.submit(self._dispatch, pending)
+
+    def _dispatch(self, pending: list):
+        """
+        Embed the texts of all pending requests, every caller's future is always resolved.
+        """
+        try:
+            self._embed_pending(pending)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _embed_pending(self, pending: list):
+        """
+        Embed the texts of all pending requests in as few backend calls as the limits allow.
+        """
+        count_tokens = self.count_tokens or (lambda text: 0)
+        items = [(caller, index, text, count_tokens(text))
+                 for caller, (texts, _) in enumerate(pending) for index, text in enumerate(texts)]
+        results = [[None]*len(texts) for texts, _ in pending]
+        errors = {}
+
+        for batch in plan_batches(items, self.max_inputs, self.max_tokens):
+            callers = {item[0] for item in batch}
+            start = perf_counter()
+            try:
+                vectors = self.base.embed_documents([item[2] for item in batch])
+            except Exception as e:
+                for caller in callers:
+                    errors[caller] = e
+                continue
+            tokens = f"{sum(item[3] for item in batch)} TOKENS, " if self.count_tokens else ""
+            print(f"EMBEDDING BATCH: {len(batch)} TEXTS, {tokens}{len(callers)} CALLERS IN {perf_counter()-start:.2f}s")
+            for (caller, index, _, _), vector in zip(batch, vectors):
+                results[caller][index] = vector
+
+        for caller, (_, future) in enumerate(pending):
+            if caller in errors:
+                future.set_exception(errors[caller])
+            else:
+                future.set_result(results[caller])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts as part of the next batch.
+        """
+        if not texts:
+            return []
+        self._ensure_started()
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result(timeout=EMBEDDING_TIMEOUT)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query as part of the next batch.
+        """
+        return self.embed_documents([text])[0]
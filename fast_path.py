@@ -0,0 +1,366 @@
+# fast_path.py - Julian Zulfikar
+# --------------------------------------
+# Answers simple factual questions (hours, phone, price, ...) straight from business_data.
+
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+DEFAULT_TIMEZONE = os.environ.get("BUSINESS_TIMEZONE") # Only used when a business's timezone is unknown
+OPEN_NOW_MAX_AGE = int(os.environ.get("OPEN_NOW_MAX_AGE", 60*15)) # Trust Fusion's is_open_now for this long
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MAX_QUERY_WORDS = 12
+
+# Fusion only gives the state/country of a business, states spanning two zones use the majority one
+STATE_TIMEZONES = {
+    **dict.fromkeys(["CT", "DC", "DE", "FL", "GA", "IN", "KY", "MA", "MD", "ME", "MI", "NC", "NH", "NJ", "NY",
+                     "OH", "PA", "RI", "SC", "VA", "VT", "WV"], "America/New_York"),
+    **dict.fromkeys(["AL", "AR", "IA", "IL", "KS", "LA", "MN", "MO", "MS", "ND", "NE", "OK", "SD", "TN", "TX",
+                     "WI"], "America/Chicago"),
+    **dict.fromkeys(["CO", "ID", "MT", "NM", "UT", "WY"], "America/Denver"),
+    **dict.fromkeys(["CA", "NV", "OR", "WA"], "America/Los_Angeles"),
+    "AZ": "America/Phoenix", "AK": "America/Anchorage", "HI": "Pacific/Honolulu", "PR": "America/Puerto_Rico"
+}
+PROVINCE_TIMEZONES = {
+    "ON": "America/Toronto", "QC": "America/Toronto", "BC": "America/Vancouver", "AB": "America/Edmonton",
+    "MB": "America/Winnipeg", "SK": "America/Regina", "NS": "America/Halifax", "NB": "America/Halifax",
+    "PE": "America/Halifax", "NL": "America/St_Johns"
+}
+COUNTRY_TIMEZONES = {
+    "GB": "Europe/London", "IE": "Europe/Dublin", "FR": "Europe/Paris", "DE": "Europe/Berlin", "IT": "Europe/Rome",
+    "ES": "Europe/Madrid", "NL": "Europe/Amsterdam", "BE": "Europe/Brussels", "AT": "Europe/Vienna",
+    "CH": "Europe/Zurich", "PT": "Europe/Lisbon", "DK": "Europe/Copenhagen", "SE": "Europe/Stockholm",
+    "NO": "Europe/Oslo", "FI": "Europe/Helsinki", "PL": "Europe/Warsaw", "CZ": "Europe/Prague",
+    "JP": "Asia/Tokyo", "SG": "Asia/Singapore", "TW": "Asia/Taipei", "HK": "Asia/Hong_Kong", "NZ": "Pacific/Auckland"
+}
+
+# Questions mentioning these need the reviews/LLM, never answer them here
+OPINION = re.compile(r"\b(recommend|best|worst|good|bad|great|worth|review|reviews|people|say|think|dish|dishes|taste|service|busy|wait|vibe|should)\b")
+# Hours/open questions about part of the business ("happy hour", "is the patio open") are not its regular hours
+SUB_THINGS = re.compile(r"\b(happy hours?|kitchen|patio|bar|brunch|breakfast|lunch|dinner|rooftop|terrace|pool|gym|spa|"
+                        r"pharmacy|parking|drive[- ]?(thru|through)|delivery|takeout|pickup|buffet)\b")
+TIME_INTENTS = {"open_at", "open_now", "hours"}
+
+INTENTS = [
+    ("open_at", re.compile(r"\b(open|closed)\b.*(\b(at|by|on|around|until|till)\b.*(\d{1,2}(:\d{2})?\s*(am|pm)?|noon|midnight)|"
+                           r"\b(" + '|'.join(DAYS) + r"|today|tomorrow|tonight)\b)")),
+    ("open_now", re.compile(r"\b(open|closed)\b.*\b(now|right now|currently|at the moment)\b|^(is|are)\s+(it|they|this place|the restaurant)\s+(open|closed)\W*$")),
+    ("hours", re.compile(r"\b(hours|opening|closing|what time|when do(es)? (it|they) (open|close))\b")),
+    ("phone", re.compile(r"\b(phone|telephone|contact) (number|#)\b|\bwhat('s| is) (their|the|its|your) (phone|number)\b|"
+                         r"\bhow (do|can) i (call|contact|reach) (them|it|you|the (business|restaurant|place|store))\W*$")),
+    ("price", re.compile(r"\bprice range\b|\b(is|are) (it|they|this place|the (business|restaurant|place|store)) (expensive|cheap|pricey|affordable)\b|"
+                         r"\bhow (expensive|pricey|cheap|affordable) (is|are) (it|they|this place|the (business|restaurant|place|store))\b")),
+    ("location", re.compile(r"\bwhat('s| is) (the|their|its|your) (address|location)\b|\b(is|are) (it|they|you) located\b|"
+                            r"\bwhere('s| is| are)\s+(it|they|you|this place|the (business|restaurant|place|store))(\s+located)?\W*$")),
+    ("categories", re.compile(r"\b(cuisine|category|categories|what kind of (food|place|restaurant)|what type of (food|place|restaurant))\b")),
+    ("transactions", re.compile(r"\b(delivery|deliver|pickup|pick up|pick-up|takeout|take out|reservation|reservations)\b"))
+]
+TRANSACTION_NAMES = {"delivery": "delivery", "pickup": "pickup", "restaurant_reservation": "reservations"}
+TRANSACTION_PATTERNS = {
+    "delivery": re.compile(r"\b(delivery|deliver)\b"),
+    "pickup": re.compile(r"\b(pickup|pick up|pick-up|takeout|take out)\b"),
+    "reservations": re.compile(r"\b(reservation|reservations)\b")
+}
+
+
+def classify(query: str):
+    """
+    Return the single factual intent of the query, or None if it should go to the RAG chains.
+    """
+    query = query.lower().strip()
+    if len(query.split()) > MAX_QUERY_WORDS or OPINION.search(query):
+        return None
+
+    matches = [intent for intent, pattern in INTENTS if pattern.search(query)]
+    # "open_at"/"open_now" are more specific than "hours"
+    if matches and matches[0] in {"open_at", "open_now"}:
+        matches = [matches[0]] + [intent for intent in matches[1:] if intent not in {"open_now", "hours"}]
+    if len(matches) != 1 or (matches[0] in TIME_INTENTS and SUB_THINGS.search(query)):
+        return None
+    return matches[0]
+
+
+def business_timezone(location: dict):
+    """
+    IANA timezone name of a business from its Fusion location (state and country), None if unknown.
+    """
+    location = location or {}
+    country, state = location.get("country"), location.get("state")
+    if country == "US":
+        return STATE_TIMEZONES.get(state)
+    if country == "CA":
+        return PROVINCE_TIMEZONES.get(state)
+    return COUNTRY_TIMEZONES.get(country)
+
+
+def _now(business_data: dict):
+    """
+    Current time at the business, None if its timezone is unknown.
+    """
+    name = business_data.get("timezone") or DEFAULT_TIMEZONE
+    if not name or ZoneInfo is None:
+        return None
+    try:
+        return datetime.now(ZoneInfo(name)).replace(tzinfo=None)
+    except Exception:
+        return None
+
+
+def _fresh_open_now(business_data: dict):
+    """
+    Fusion's is_open_now, only if it was fetched within OPEN_NOW_MAX_AGE (cached data goes stale).
+    """
+    fetched_at = business_data.get("fetched_at")
+    if fetched_at and time.time()-fetched_at <= OPEN_NOW_MAX_AGE:
+        return business_data.get("is_open_now")
+    return None
+
+
+def _regular_hours(business_data: dict) -> list:
+    """
+    Fusion "open" intervals, e.g. {"day": 0, "start": "1100", "end": "2100", "is_overnight": False}.
+    """
+    try:
+        return business_data["hours"][0]["open"] or []
+    except (KeyError, IndexError, TypeError):
+        return []
+
+
+def is_open_at(business_data: dict, when: datetime):
+    """
+    Whether the business is open at the given local time, None if hours are unknown.
+        Day 0 is Monday, matching both Fusion and datetime.weekday().
+    """
+    intervals = _regular_hours(business_data)
+    if not intervals:
+        return None
+
+    day, hhmm = when.weekday(), when.strftime("%H%M")
+    for interval in intervals:
+        start, end = interval["start"], interval["end"]
+        overnight = interval.get("is_overnight") or end <= start
+        if interval["day"] == day and start <= hhmm and (overnight or hhmm < end):
+            return True
+        # Overnight intervals from the previous day spill into this one
+        if overnight and interval["day"] == (day-1) % 7 and hhmm < end:
+            return True
+    return False
+
+
+def _format_time(hhmm: str) -> str:
+    return datetime.strptime(hhmm if hhmm != "2400" else "0000", "%H%M").strftime("%I:%M %p").lstrip('0')
+
+
+def format_hours(business_data: dict) -> str:
+    """
+    Human readable weekly hours, one line per day.
+    """
+    lines = []
+    intervals = _regular_hours(business_data)
+    for day, day_name in enumerate(DAYS):
+        spans = [f"{_format_time(i['start'])} - {_format_time(i['end'])}" for i in intervals if i["day"] == day]
+        lines.append(f"{day_name.capitalize()}: {', '.join(spans) if spans else 'Closed'}")
+    return '\n'.join(lines)
+
+
+def parse_when(query: str, now: datetime):
+    """
+    Resolve "at 9pm Friday"/"tomorrow at noon"/"on Sunday"/"until 1am tonight" to (datetime, whole_day).
+        Returns (None, False) if no day or time is mentioned.
+    """
+    query = query.lower()
+    when = now
+
+    day_match = re.search(r"\b(" + '|'.join(DAYS) + r"|tomorrow|today|tonight)\b", query)
+    tonight = bool(day_match) and day_match.group(1) == "tonight"
+    if day_match:
+        day = day_match.group(1)
+        if day == "tomorrow":
+            when = when + timedelta(days=1)
+        elif day in DAYS:
+            when = when + timedelta(days=(DAYS.index(day) - when.weekday()) % 7)
+
+    time_match = re.search(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b(?!\s*(st|nd|rd|th))", query)
+    if "noon" in query:
+        hour, minute = 12, 0
+    elif "midnight" in query:
+        hour, minute = 0, 0
+    elif time_match and int(time_match.group(1)) <= 24:
+        hour, minute = int(time_match.group(1)), int(time_match.group(2) or 0)
+        if time_match.group(3) == "pm" and hour < 12:
+            hour += 12
+        elif time_match.group(3) == "am" and hour == 12:
+            hour = 0
+        elif not time_match.group(3) and tonight and 5 <= hour <= 11:
+            hour += 12 # "at 11 tonight" is 11 PM
+        elif not time_match.group(3) and tonight and hour == 12:
+            hour = 0 # "until 12 tonight" is midnight, "until 2 tonight" stays 2 AM
+        elif not time_match.group(3) and not tonight and 1 <= hour <= 6:
+            hour += 12 # "open at 5" almost always means the evening
+    elif tonight:
+        hour, minute = 20, 0
+    elif day_match:
+        return when.replace(hour=0, minute=0, second=0, microsecond=0), True # Whole day asked about
+    else:
+        return None, False
+
+    # Early morning "tonight" (e.g. "until 1am tonight") is after midnight
+    if tonight and hour % 24 < 6:
+        when = when + timedelta(days=1)
+    return when.replace(hour=hour % 24, minute=minute, second=0, microsecond=0), False
+
+
+def answer_structured(query: str, business_data: dict, now: datetime = None):
+    """
+    Answer a factual question directly from business_data.
+        now is the business's local time, derived from its timezone if not given.
+        Returns None when the query is not a (confidently) factual question or the data is missing.
+    """
+    intent = classify(query)
+    if not intent:
+        return None
+    now = now or _now(business_data)
+    name = business_data.get("name") or "The business"
+    print("FAST PATH:", intent)
+
+    if intent == "open_now":
+        is_open = _fresh_open_now(business_data)
+        if is_open is None and now:
+            is_open = is_open_at(business_data, now)
+        if is_open is None:
+            return None
+        return f"{name} is {'open' if is_open else 'closed'} right now."
+
+    elif intent == "open_at":
+        if not now:
+            return None
+        when, whole_day = parse_when(query, now)
+        if when is None or not _regular_hours(business_data):
+            return None
+        if whole_day:
+            day = when.weekday()
+            on_day = "today" if when.date() == now.date() else f"on {DAYS[day].capitalize()}"
+            spans = [f"{_format_time(i['start'])} - {_format_time(i['end'])}" for i in _regular_hours(business_data) if i["day"] == day]
+            if not spans:
+                return f"{name} is closed {on_day}."
+            return f"{name} is open {on_day} from {', '.join(spans)}."
+        is_open = is_open_at(business_data, when)
+        return f"{name} is {'open' if is_open else 'closed'} on {DAYS[when.weekday()].capitalize()} at {when.strftime('%I:%M %p').lstrip('0')}."
+
+    elif intent == "hours":
+        if not _regular_hours(business_data):
+            return None
+        return f"The hours of {name} are:\n{format_hours(business_data)}"
+
+    elif intent == "phone":
+        return f"The phone number of {name} is {business_data['phone']}." if business_data.get("phone") else None
+
+    elif intent == "price":
+        return f"The price range of {name} is: {business_data['price_range']}." if business_data.get("price_range") else None
+
+    elif intent == "location":
+        location = business_data.get("location")
+        if not location:
+            return None
+        return f"{name} is located at {', '.join(location) if isinstance(location, list) else location}."
+
+    elif intent == "categories":
+        categories = business_data.get("categories")
+        return f"{name} is categorized on Yelp as: {', '.join(categories)}." if categories else None
+
+    elif intent == "transactions":
+        transactions = business_data.get("transactions")
+        if transactions is None:
+            return None
+        offered = [TRANSACTION_NAMES.get(t, t) for t in transactions]
+        asked = [kind for kind, pattern in TRANSACTION_PATTERNS.items() if pattern.search(query.lower())]
+        if len(asked) == 1:
+            return f"{name} {'offers' if asked[0] in offered else 'does not list'} {asked[0]} on Yelp."
+        if not offered:
+            return f"{name} does not list delivery, pickup or reservations on Yelp."
+        return f"{name} offers the following on Yelp: {', '.join(offered)}."
+
+    return None
+
+
+if __name__ == "__main__":
+    """
+    Table-driven checks of the phrasings the fast path must (not) answer: python fast_path.py
+    """
+    bar = {
+        "name": "Bert's Bar", "phone": "(123) 456-7890", "price_range": "$$", "location": ["123 Bert St", "Irvine, CA 92612"],
+        "hours": [{"open": [{"day": day, "start": "1700", "end": "0200", "is_overnight": True} for day in range(6)]}],
+        "is_open_now": True, "fetched_at": time.time()-60*60*6, "timezone": "America/New_York"
+    }
+    monday_noon = datetime(2023, 10, 16, 12, 0)
+
+    CASES = [
+        # (query, expected substring of the answer, or None if it must go to the LLM)
+        ("is it open at 11 tonight", "open on Monday at 11:00 PM"),
+        ("open until 1am tonight?", "open on Tuesday at 1:00 AM"),
+        ("open until 12 tonight?", "open on Tuesday at 12:00 AM"),
+        ("is it open at 5 on sunday", "closed on Sunday at 5:00 PM"),
+        ("is it open today?", "open today from 5:00 PM - 2:00 AM"),
+        ("are they open on sunday?", "closed on Sunday"),
+        ("is it open now?", "closed right now"),
+        ("is it open right now?", "closed right now"),
+        ("Is there parking near the location?", None),
+        ("Can I call ahead to order?", None),
+        ("What is the maximum number of guests?", None),
+        ("Where is the closest parking?", None),
+        ("What is the address?", "located at 123 Bert St"),
+        ("Where is it located?", "located at 123 Bert St"),
+        ("What's their phone number?", "(123) 456-7890"),
+        ("How can I contact them?", "(123) 456-7890"),
+        ("What is the price range?", "price range of Bert's Bar is: $$"),
+        ("Is it expensive?", "price range of Bert's Bar is: $$"),
+        ("How much is the wagyu?", None),
+        ("What is the price of the omakase?", None),
+        ("How much is parking?", None),
+        ("How much is a drink?", None),
+        ("What are the hours for happy hour?", None),
+        ("Is the patio open now?", None),
+        ("Is the kitchen open at 11 tonight?", None),
+        ("What are the hours?", "The hours of Bert's Bar are"),
+    ]
+    TIMEZONES = [
+        ({"state": "NY", "country": "US"}, "America/New_York"),
+        ({"state": "AZ", "country": "US"}, "America/Phoenix"),
+        ({"state": "BC", "country": "CA"}, "America/Vancouver"),
+        ({"country": "GB"}, "Europe/London"),
+        ({"country": "XX"}, None),
+    ]
+
+    failures = 0
+    for query, expected in CASES:
+        answer = answer_structured(query, bar, now=monday_noon)
+        passed = answer is None if expected is None else bool(answer) and expected in answer
+        failures += not passed
+        print("PASS" if passed else "FAIL", repr(query), "->", repr(answer))
+    for location, expected in TIMEZONES:
+        passed = business_timezone(location) == expected
+        failures += not passed
+        print("PASS" if passed else "FAIL", location, "->", business_timezone(location))
+
+    # A stale cached is_open_now is ignored, a fresh one wins over the regular hours (special hours),
+    # and without a known timezone time-relative questions go to the LLM
+    STATEFUL = [
+        ("is it open now?", bar, monday_noon, "closed right now"),
+        ("is it open now?", dict(bar, fetched_at=time.time()), monday_noon, "open right now"),
+        ("is it open at 11 tonight", dict(bar, timezone=None), None, None),
+    ]
+    for query, data, now, expected in STATEFUL:
+        answer = answer_structured(query, data, now=now)
+        passed = answer is None if expected is None else bool(answer) and expected in answer
+        failures += not passed
+        print("PASS" if passed else "FAIL", repr(query), "->", repr(answer))
+
+    print(f"{failures} FAILED" if failures else "ALL PASSED")
+    raise SystemExit(1 if failures else 0)
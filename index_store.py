@@ -0,0 +1,173 @@
+# index_store.py - Julian Zulfikar
+# --------------------------------------
+# Persisted business data and versioned per-business vector indexes in Redis.
+
+import os
+import re
+import json
+
+from embedding_backends import get_embeddings, embedding_id
+from numpy_store import get_vectorstore_cls, VECTOR_STORE
+from shell import build_info_index, review_documents
+
+# Indexes are only readable by the same embedding backend/model and store type which built them
+INDEX_KEY_PREFIX = f"quickyelp:index:{embedding_id()}:{VECTOR_STORE}:"
+BUSINESS_KEY_PREFIX = "quickyelp:business:"
+INDEX_TTL = int(os.environ.get("INDEX_TTL", 60*60*24)) # Yelp Fusion data may be cached for at most 24 hours
+INDEX_GRACE_PERIOD = int(os.environ.get("INDEX_GRACE_PERIOD", 60*10)) # Replaced versions stay readable this long
+INDEX_LOCK_TIMEOUT = 120
+
+
+def business_key(business_data: dict) -> str:
+    """
+    Stable key for a business: its Yelp alias, or a slug of name and location.
+    """
+    url = business_data.get("url")
+    if url and "/biz/" in url:
+        return re.split(r"[/?]", url.split("/biz/")[1])[0]
+    location = business_data.get("location") or ""
+    if isinstance(location, list):
+        location = ' '.join(location)
+    return re.sub(r"[^a-z0-9]+", '-', f"{business_data.get('name') or ''} {location}".lower()).strip('-')
+
+
+def _key(key: str, kind: str, field: str) -> str:
+    return f"{INDEX_KEY_PREFIX}{key}:{kind}:{field}"
+
+
+def current_version(redis_client, key: str, kind: str) -> int:
+    """
+    Version number readers should use for this business index, 0 if none is stored.
+    """
+    version = redis_client.get(_key(key, kind, "current"))
+    return int(version) if version else 0
+
+
+def load_index(redis_client, key: str, kind: str, embeddings=None):
+    """
+    Load the current version of a business index.
+        Returns (store, version, manifest), or (None, 0, []) if nothing is stored.
+    """
+    version = current_version(redis_client, key, kind)
+    if not version:
+        return None, 0, []
+
+    pipe = redis_client.pipeline()
+    pipe.get(_key(key, kind, f"v{version}"))
+    pipe.get(_key(key, kind, f"v{version}:manifest"))
+    serialized, manifest = pipe.execute()
+    if serialized is None:
+        return None, 0, []
+
+    store = get_vectorstore_cls().deserialize_from_bytes(serialized=serialized, embeddings=embeddings or get_embeddings())
+    return store, version, json.loads(manifest) if manifest else []
+
+
+def publish_index(redis_client, key: str, kind: str, store, manifest: list = None) -> int:
+    """
+    Write the store as a new immutable version, then point readers at it.
+        The previous version is kept for INDEX_GRACE_PERIOD so in-flight readers stay consistent.
+    """
+    old_version = current_version(redis_client, key, kind)
+    version = redis_client.incr(_key(key, kind, "counter"))
+
+    pipe = redis_client.pipeline()
+    pipe.setex(_key(key, kind, f"v{version}"), INDEX_TTL, store.serialize_to_bytes())
+    pipe.setex(_key(key, kind, f"v{version}:manifest"), INDEX_TTL, json.dumps(manifest or []))
+    pipe.setex(_key(key, kind, "current"), INDEX_TTL, version)
+    pipe.expire(_key(key, kind, "counter"), INDEX_TTL)
+    if old_version:
+        pipe.expire(_key(key, kind, f"v{old_version}"), INDEX_GRACE_PERIOD)
+        pipe.expire(_key(key, kind, f"v{old_version}:manifest"), INDEX_GRACE_PERIOD)
+    pipe.execute()
+
+    print(f"PUBLISHED {kind.upper()} INDEX {key} V{version}")
+    return version
+
+
+def touch_index(redis_client, key: str, kind: str, version: int):
+    """
+    Extend the expiry of an unchanged index to INDEX_TTL, in step with its re-saved business data.
+    """
+    pipe = redis_client.pipeline()
+    for field in ["current", "counter", f"v{version}", f"v{version}:manifest"]:
+        pipe.expire(_key(key, kind, field), INDEX_TTL)
+    pipe.execute()
+
+
+def refresh_review_index(redis_client, key: str, business_data: dict, embeddings=None):
+    """
+    Bring the stored review index up to date with freshly scraped reviews.
+        Only new reviews are embedded and appended; reviews which disappeared are tombstoned.
+        Returns (store, version).
+    """
+    embeddings = embeddings or get_embeddings()
+    texts, metadatas, ids = review_documents(business_data)
+
+    with redis_client.lock(_key(key, "reviews", "lock"), timeout=INDEX_LOCK_TIMEOUT):
+        store, version, manifest = load_index(redis_client, key, "reviews", embeddings)
+
+        if store is None:
+            print("BUILDING REVIEW INDEX:", key)
+            store = get_vectorstore_cls().from_texts(texts, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            stored = set(manifest)
+            added = [i for i, doc_id in enumerate(ids) if doc_id not in stored]
+            removed = list(stored - set(ids))
+            print(f"UPDATING REVIEW INDEX: {key} (+{len(added)} NEW, -{len(removed)} REMOVED)")
+            if not added and not removed:
+                touch_index(redis_client, key, "reviews", version)
+                return store, version
+
+            if added:
+                store.add_texts([texts[i] for i in added], metadatas=[metadatas[i] for i in added], ids=[ids[i] for i in added])
+            if removed:
+                store.delete(removed)
+
+        version = publish_index(redis_client, key, "reviews", store, ids)
+    return store, version
+
+
+def save_business_data(redis_client, key: str, business_data: dict):
+    """
+    Persist the retrieved business_data so later chats can skip Yelp entirely.
+    """
+    redis_client.setex(BUSINESS_KEY_PREFIX+key, INDEX_TTL, json.dumps(business_data))
+
+
+def load_business_data(redis_client, key: str):
+    """
+    Previously persisted business_data, or None.
+    """
+    business_data = redis_client.get(BUSINESS_KEY_PREFIX+key)
+    return json.loads(business_data) if business_data else None
+
+
+def store_business(redis_client, business_data: dict, embeddings=None):
+    """
+    Persist business_data and publish both of its indexes.
+        Returns (key, info_db, review_db).
+    """
+    embeddings = embeddings or get_embeddings()
+    key = business_key(business_data)
+    save_business_data(redis_client, key, business_data)
+
+    info_db = build_info_index(business_data, embeddings)
+    publish_index(redis_client, key, "info", info_db)
+    review_db, _ = refresh_review_index(redis_client, key, business_data, embeddings)
+    return key, info_db, review_db
+
+
+def load_business(redis_client, key: str, embeddings=None):
+    """
+    Load a persisted business and its indexes.
+        Returns (business_data, info_db, review_db), or None if any part is missing.
+    """
+    business_data = load_business_data(redis_client, key)
+    if not business_data:
+        return None
+    info_db, _, _ = load_index(redis_client, key, "info", embeddings)
+    review_db, _, _ = load_index(redis_client, key, "reviews", embeddings)
+    if info_db is None or review_db is None:
+        return None
+    return business_data, info_db, review_db
@@ -0,0 +1,146 @@
+# model_router.py - Julian Zulfikar
+# --------------------------------------
+# Latency-aware model routing with hedged fallback calls.
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import perf_counter
+
+from langchain.chat_models import ChatOpenAI
+
+FAST_MODEL = os.environ.get("FAST_MODEL", "gpt-3.5-turbo")
+LARGE_MODEL = os.environ.get("LARGE_MODEL", "gpt-4")
+LATENCY_BUDGET = float(os.environ.get("LATENCY_BUDGET", 25)) # Seconds per request, across all attempts
+HEDGE_AFTER = float(os.environ.get("HEDGE_AFTER", 10)) # Start the fallback if the primary is still running
+MIN_HEDGE_AFTER = 2.0
+EWMA_ALPHA = 0.2
+MODEL_MAX_RETRIES = int(os.environ.get("MODEL_MAX_RETRIES", 0)) # The hedged fallback is the retry
+DEMOTE_AFTER = float(os.environ.get("DEMOTE_AFTER", 0.6*LATENCY_BUDGET)) # Stop leading with the large model above this latency
+LATENCY_MAX_AGE = float(os.environ.get("LATENCY_MAX_AGE", 60*5)) # Older latency estimates are forgotten, ending a demotion
+
+# Questions which need synthesis across reviews go to the large model
+COMPLEX = re.compile(r"\b(compare|comparison|consensus|overall|summar\w*|pros|cons|why|recommend\w*|best|worst|opinions?|"
+                     r"think|versus|vs|difference|experience|worth|general|should)\b")
+SIMPLE_MAX_WORDS = 12
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("ROUTER_THREADS", 16)))
+
+
+class LatencyStats:
+    """
+    Thread-safe per-model latency (EWMA) and failure counts for this process.
+        An estimate not updated for LATENCY_MAX_AGE is dropped, so a demoted model gets retried.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.updated = {}
+        self.calls = {}
+        self.failures = {}
+
+    def _current(self, model: str):
+        if perf_counter()-self.updated.get(model, 0) > LATENCY_MAX_AGE:
+            self.latency.pop(model, None)
+        return self.latency.get(model)
+
+    def record(self, model: str, elapsed: float, failed: bool = False):
+        """
+        Failures only count towards latency if they overran the budget (i.e. timed out).
+        """
+        with self.lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            if failed:
+                self.failures[model] = self.failures.get(model, 0) + 1
+                if elapsed < LATENCY_BUDGET:
+                    return
+            previous = self._current(model)
+            self.latency[model] = elapsed if previous is None else (1-EWMA_ALPHA)*previous + EWMA_ALPHA*elapsed
+            self.updated[model] = perf_counter()
+
+    def get(self, model: str):
+        with self.lock:
+            return self._current(model)
+
+
+STATS = LatencyStats()
+
+
+def chat_llm(model: str) -> ChatOpenAI:
+    """
+    Chat model used by the QA chains, bounded by the latency budget.
+        Retries are off by default, otherwise request_timeout applies to every attempt.
+    """
+    return ChatOpenAI(temperature=0, model=model, request_timeout=LATENCY_BUDGET, max_retries=MODEL_MAX_RETRIES)
+
+
+def choose_models(query: str, kind: str) -> list:
+    """
+    Ordered [primary, fallback] models for a query.
+        kind is "info", "reviews", "merge" or "unified"; only complex review synthesis uses the large model first.
+    """
+    complex_query = bool(COMPLEX.search(query.lower())) or len(query.split()) > SIMPLE_MAX_WORDS
+    models = [LARGE_MODEL, FAST_MODEL] if complex_query and kind != "info" else [FAST_MODEL, LARGE_MODEL]
+
+    # If the large model is currently too slow (e.g. timing out), lead with the fast one
+    large_latency = STATS.get(LARGE_MODEL)
+    if models[0] == LARGE_MODEL and large_latency and large_latency > DEMOTE_AFTER:
+        models.reverse()
+    return models
+
+
+def _hedge_after(model: str) -> float:
+    """
+    Hedge sooner for models which usually answer quickly.
+    """
+    latency = STATS.get(model)
+    return HEDGE_AFTER if latency is None else max(MIN_HEDGE_AFTER, min(HEDGE_AFTER, 2*latency))
+
+
+def _timed(call, model: str):
+    start = perf_counter()
+    try:
+        result = call(model)
+    except Exception:
+        STATS.record(model, perf_counter()-start, failed=True)
+        raise
+    STATS.record(model, perf_counter()-start)
+    return result
+
+
+def run_routed(call, query: str, kind: str):
+    """
+    Run call(model) on the routed primary model within LATENCY_BUDGET.
+        If the primary is slow a hedged call is started on the fallback, and if it fails the
+        fallback is used directly; the first successful result wins.
+    """
+    primary, fallback = choose_models(query, kind)
+    print(f"ROUTING {kind.upper()} QUERY TO {primary} (FALLBACK {fallback})")
+    start = perf_counter()
+
+    pending = {_executor.submit(_timed, call, primary): primary}
+    done, _ = wait(pending, timeout=_hedge_after(primary))
+    if not done or next(iter(done)).exception():
+        print(f"HEDGING WITH {fallback} ({'PRIMARY FAILED' if done else 'PRIMARY SLOW'})")
+        if done:
+            pending.clear()
+        pending[_executor.submit(_timed, call, fallback)] = fallback
+
+    error = None
+    while pending:
+        remaining = LATENCY_BUDGET - (perf_counter()-start)
+        done, _ = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            model = pending.pop(future)
+            if future.exception() is None:
+                print(f"ANSWERED BY {model} IN {perf_counter()-start:.2f}s")
+                return future.result()
+            error = future.exception()
+            print(f"{model} FAILED:", repr(error))
+
+    if error and not pending:
+        raise error
+    raise TimeoutError(f"No model answered within {LATENCY_BUDGET} seconds")
@@ -0,0 +1,227 @@
+# numpy_store.py - Julian Zulfikar
+# --------------------------------------
+# Brute-force NumPy vector store for small per-business corpora.
+
+import os
+import json
+import uuid
+import struct
+from typing import Any, Iterable, List, Optional, Tuple, Type
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.base import VectorStore
+
+# Selected per deployment: "numpy" (default) or "faiss"
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "numpy").lower()
+VECTOR_DTYPE = os.environ.get("VECTOR_DTYPE", "float32").lower()
+
+MAGIC = b"QYNP1"
+ALIGNMENT = 64
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact top-k search over one contiguous (n, dim) matrix of normalized embeddings.
+        Scores are cosine similarities, so higher is more relevant.
+        Deleted rows are tombstoned (by row, so a re-added id is live again) and skipped until the store is compacted.
+    """
+    def __init__(self, embedding: Embeddings, matrix: Optional[np.ndarray] = None, texts: Optional[List[str]] = None,
+                 metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, dtype: str = VECTOR_DTYPE,
+                 deleted_rows: Optional[Iterable[int]] = None):
+        self.embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.matrix = matrix if matrix is not None else np.zeros((0, 0), dtype=self.dtype)
+        self.texts = texts or []
+        self.metadatas = metadatas or [{} for _ in self.texts]
+        self.ids = ids or [str(uuid.uuid4()) for _ in self.texts]
+        self.deleted_rows = set(deleted_rows or [])
+        self._mask = None
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def _normalize(self, vectors) -> np.ndarray:
+        """
+        Convert vectors to a 2D float32 array of unit length rows.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """
+        Embed and append texts to the store.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        vectors = self._normalize(self.embedding.embed_documents(texts)).astype(self.dtype)
+        # Build a new matrix instead of resizing, readers holding the old one are unaffected
+        self.matrix = vectors if not len(self.texts) else np.concatenate([self.matrix, vectors])
+        self.texts = self.texts + texts
+        self.metadatas = self.metadatas + list(metadatas)
+        self.ids = self.ids + list(ids)
+        self._mask = None
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Tombstone the rows of the given ids, compacting once more than half of the rows are dead.
+        """
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        ids = set(ids)
+        self.deleted_rows |= {i for i, doc_id in enumerate(self.ids) if doc_id in ids}
+        self._mask = None
+        if len(self.deleted_rows) * 2 > len(self.ids):
+            self.compact()
+        return True
+
+    def compact(self):
+        """
+        Drop tombstoned rows from the matrix (no re-embedding needed).
+        """
+        if not self.deleted_rows:
+            return
+        keep = [i for i in range(len(self.ids)) if i not in self.deleted_rows]
+        self.matrix = self.matrix[keep] if keep else np.zeros((0, 0), dtype=self.dtype)
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.deleted_rows = set()
+        self._mask = None
+
+    def _dead_rows(self) -> Optional[np.ndarray]:
+        """
+        Boolean mask of tombstoned rows, or None if there are none.
+        """
+        if not self.deleted_rows:
+            return None
+        if self._mask is None:
+            self._mask = np.zeros(len(self.ids), dtype=bool)
+            self._mask[list(self.deleted_rows)] = True
+        return self._mask
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        Indices and scores of the k highest scores, best first.
+        """
+        dead = self._dead_rows()
+        if dead is not None:
+            scores = np.where(dead, -np.inf, scores)
+        k = min(k, len(scores) - (int(dead.sum()) if dead is not None else 0))
+        if k <= 0:
+            return []
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k-1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in candidates]
+
+    def _to_documents(self, hits: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        return [(Document(page_content=self.texts[i], metadata=dict(self.metadatas[i])), score) for i, score in hits]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Exact top-k with a single matrix-vector product.
+        """
+        if not len(self.texts):
+            return []
+        query = self._normalize(embedding)[0].astype(self.dtype)
+        scores = (self.matrix @ query).astype(np.float32)
+        return self._to_documents(self._top_k(scores, k))
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_batch(self, queries: List[str], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """
+        Answer many queries at once: one embedding request and one batched matmul.
+        """
+        if not queries:
+            return []
+        if not len(self.texts):
+            return [[] for _ in queries]
+        query_matrix = self._normalize(self.embedding.embed_documents(queries)).astype(self.dtype)
+        scores = (query_matrix @ self.matrix.T).astype(np.float32)
+        return [self._to_documents(self._top_k(row, k)) for row in scores]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity is already "higher is better", clip into [0, 1]
+        return lambda score: min(1.0, max(0.0, score))
+
+    def serialize_to_bytes(self) -> bytes:
+        """
+        Serialize as [magic][header length][JSON header][padding][raw matrix].
+        """
+        header = json.dumps({
+            "dtype": self.dtype.str,
+            "shape": list(self.matrix.shape),
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "ids": self.ids,
+            "deleted_rows": sorted(self.deleted_rows)
+        }).encode()
+        offset = len(MAGIC) + 4 + len(header)
+        padding = (-offset) % ALIGNMENT
+        return b"".join([MAGIC, struct.pack("<I", len(header)), header, b" " * padding,
+                         np.ascontiguousarray(self.matrix).tobytes()])
+
+    @classmethod
+    def deserialize_from_bytes(cls, serialized: bytes, embeddings: Embeddings, **kwargs: Any) -> "NumpyVectorStore":
+        """
+        Load a serialized store; the matrix is a read-only view over the buffer (no copy).
+        """
+        buffer = memoryview(serialized)
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a serialized NumpyVectorStore")
+        (header_length,) = struct.unpack("<I", buffer[len(MAGIC):len(MAGIC)+4])
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start+header_length]))
+        offset = start + header_length
+        offset += (-offset) % ALIGNMENT
+
+        dtype = np.dtype(header["dtype"])
+        shape = tuple(header["shape"])
+        matrix = np.frombuffer(serialized, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        deleted_rows = header.get("deleted_rows")
+        if deleted_rows is None and header.get("deleted"):
+            # Older blobs tombstoned ids
+            deleted = set(header["deleted"])
+            deleted_rows = [i for i, doc_id in enumerate(header["ids"]) if doc_id in deleted]
+        return cls(embeddings, matrix=matrix, texts=header["texts"], metadatas=header["metadatas"],
+                   ids=header["ids"], dtype=dtype.name, deleted_rows=deleted_rows)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def get_vectorstore_cls() -> Type[VectorStore]:
+    """
+    Return the vector store class configured for this deployment.
+    """
+    if VECTOR_STORE == "numpy":
+        return NumpyVectorStore
+    elif VECTOR_STORE == "faiss":
+        from langchain.vectorstores import FAISS
+        return FAISS
+    else:
+        raise ValueError(f"Unknown VECTOR_STORE: {VECTOR_STORE}")
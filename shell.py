@@ -13,19 +13,41 @@ import os
 import re
 import json
 import time
+import sys
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import openai
-from langchain.document_loaders import TextLoader
-from langchain.chat_models import ChatOpenAI
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.chains import RetrievalQA
+from langchain.schema import SystemMessage, HumanMessage, AIMessage
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from embedding_backends import get_embeddings
+from numpy_store import get_vectorstore_cls
+from context_packing import build_qa_chain, retrieve_packed, count_tokens, CONTEXT_TOKEN_BUDGET
+from model_router import chat_llm, run_routed, LATENCY_BUDGET, MODEL_MAX_RETRIES
+from fast_path import business_timezone
 
-openai.api_key = os.environ.get('OPENAI_API_KEY')
 YELP_FUSION_KEY = os.environ.get('YELP_FUSION_KEY')
 
 DEBUGGING = False
 
+INFO_PREAMBLE = "You are QuickYelp, a chatbot which is able to answer questions about a given Yelp business. \n"+ \
+    "The content provided is the background context/information of the business/restaurant that can be found on the Yelp page. \n"+ \
+    "Beware: some content is formatted in JSON format.\n\n" + \
+    "You are provided the following information about the business:\n"
+REVIEW_PREAMBLE = "You are QuickYelp, a chatbot which is able to answer questions about a given Yelp business. \n"+ \
+    "The content provided is the reviews of the business/restaurant from the experience of Yelp users who have visited the service.\n" + \
+    "Think of ratings from 4-5 stars as positive, and 1-3 stars as negative.\n\n"
+UNIFIED_PREAMBLE = "You are QuickYelp, a chatbot which is able to answer questions about a given Yelp business. \n"+ \
+    "You are given two kinds of context: [Info] entries are the background information of the business/restaurant found on the Yelp page " + \
+    "(some content is formatted in JSON), and [Review] entries are reviews from Yelp users who have visited the service.\n" + \
+    "Think of ratings from 4-5 stars as positive, and 1-3 stars as negative.\n" + \
+    "Answer the users question using both kinds of context, citing the entries each point comes from, e.g. [Info 1] or [Review 2].\n" + \
+    "If the context does not answer the question, just say that you don't know, don't try to make up an answer.\n"
+
+# "unified": one LLM call over both indexes, "legacy": separate info/review chains then merge
+ANSWER_MODE = os.environ.get("ANSWER_MODE", "unified").lower()
+
 
 def clean(input_string):
     """
@@ -54,10 +76,70 @@ def convert_yelp_dollar_signs(rating: str) -> str:
         return "No price range provided"
 
 
-def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
+class RateLimiter:
+    """
+    Thread-safe limiter which spaces calls out to at most `rate` per second.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Shared by every thread calling Yelp; set by warmup.py (None = unlimited)
+YELP_RATE_LIMITER = None
+
+
+def yelp_get(url: str, **kwargs):
+    """
+    requests.get for Yelp/Yelp Fusion, honoring the global rate limit.
+    """
+    if YELP_RATE_LIMITER:
+        YELP_RATE_LIMITER.wait()
+    return requests.get(url, **kwargs)
+
+
+def search_yelp_business(name: str, location: str):
+    """
+    Find the best matching business (a single Fusion search call).
+        Returns the Fusion business, which retrieve_yelp_info can reuse instead of searching again, or None.
+    """
+    try:
+        yf_url = f"https://api.yelp.com/v3/businesses/search?location={urllib.parse.quote(clean(location))}&term={urllib.parse.quote(clean(name))}&sort_by=best_match&limit=1"
+        api_call = yelp_get(yf_url, headers={"Authorization": "Bearer "+YELP_FUSION_KEY})
+        if api_call.status_code == 200 and api_call.json()["businesses"]:
+            return api_call.json()["businesses"][0]
+        print("API (SEARCH) STATUS CODE", api_call.status_code)
+    except Exception as e:
+        print("ERROR CALLING FUSION (SEARCH):", e)
+    return None
+
+
+def retrieve_yelp_info_by_alias(alias: str, web_app: bool = False):
+    """
+    Looks up a Yelp alias (Business Details), then retrieves it via retrieve_yelp_info.
+    """
+    yf_url = f"https://api.yelp.com/v3/businesses/{urllib.parse.quote(alias)}"
+    api_call = yelp_get(yf_url, headers={"Authorization": "Bearer "+YELP_FUSION_KEY})
+    if api_call.status_code != 200:
+        raise Exception(f"Yelp Fusion status code {api_call.status_code} for alias {alias}")
+    business = api_call.json()
+    return retrieve_yelp_info(business["name"], ', '.join(business["location"]["display_address"]), web_app=web_app, business=business)
+
+
+def retrieve_yelp_info(name: str, location: str, web_app: bool = False, business: dict = None):
     """
     Searches for the business on Yelp via Yelp Fusion API.
         Constructs a dictionary filled with data regarding the business.
+        A Fusion business already found (search_yelp_business, Business Details) skips the search call.
     """
     # Store information in business_data
     business_data = {
@@ -71,6 +153,8 @@ def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
         "price_range": None,
         "hours": None,
         "is_open_now": None,
+        "fetched_at": None,
+        "timezone": None,
         "transactions": None,
         "url": None,
         "image_url": None,
@@ -79,23 +163,24 @@ def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
 
     # Try to call Yelp Fusion API: Business Search
     # https://docs.developer.yelp.com/reference/v3_business_search
-    print("CALLING YELP FUSION API FOR BUSINESS SEARCH")
+    print("CALLING YELP FUSION API FOR BUSINESS SEARCH" if not business else "USING FUSION BUSINESS FROM EARLIER LOOKUP")
     print("NAME:", name)
     print("LOCATION:", location)
-    yelp_fusion_api_business_search = None
+    yelp_fusion_api_business_search = {"businesses": [business]} if business else None
     try:
-        yf_url = f"https://api.yelp.com/v3/businesses/search?location={urllib.parse.quote(clean(location))}&term={urllib.parse.quote(clean(name))}&sort_by=best_match&limit=1"
-        api_call = requests.get(yf_url, headers={"Authorization": "Bearer "+YELP_FUSION_KEY})
+        if not business:
+            yf_url = f"https://api.yelp.com/v3/businesses/search?location={urllib.parse.quote(clean(location))}&term={urllib.parse.quote(clean(name))}&sort_by=best_match&limit=1"
+            api_call = yelp_get(yf_url, headers={"Authorization": "Bearer "+YELP_FUSION_KEY})
 
-        attempts = 0
-        while attempts < 3:
-            if api_call.status_code == 200:
-                yelp_fusion_api_business_search = api_call.json()
-                break
-            else:
-                print("API (1) STATUS CODE", api_call.status_code)
-                print(api_call.json())
-                attempts += 1
+            attempts = 0
+            while attempts < 3:
+                if api_call.status_code == 200:
+                    yelp_fusion_api_business_search = api_call.json()
+                    break
+                else:
+                    print("API (1) STATUS CODE", api_call.status_code)
+                    print(api_call.json())
+                    attempts += 1
     except Exception as e:
         print("ERROR CALLING FUSION (1):", e)
     else:
@@ -125,6 +210,8 @@ def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
             except Exception as e: print("ERROR GETTING IMAGE URL FROM API", e)
             try: business_data["location"] = business["location"]["display_address"]
             except Exception as e: print("ERROR GETTING LOCATION FROM API", e)
+            try: business_data["timezone"] = business_timezone(business["location"])
+            except Exception as e: print("ERROR GETTING TIMEZONE FROM API", e)
 
             # Retrieve base URL
             try:
@@ -141,7 +228,7 @@ def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
                 content = []
                 for i, url in enumerate([yelp_url, yelp_url+"?start=10", yelp_url+"?start=20"]):
                     print("REQUESTING", url)
-                    response = requests.get(url)
+                    response = yelp_get(url)
                     print("RECEIVED")
                     if response.status_code == 200:
                         content.append(response.text)
@@ -213,28 +300,32 @@ def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
 
         # Try to call Yelp Fusion API: Business Details
         # https://docs.developer.yelp.com/reference/v3_business_info
-        print("CALLING YELP FUSION API FOR BUSINESS DETAILS")
-        yelp_fusion_api_business_details = None
-        try:
-            yf_url = f"https://api.yelp.com/v3/businesses/{business['id']}"
-            api_call = requests.get(yf_url, headers={"Authorization": "Bearer "+YELP_FUSION_KEY})
+        # (a Business Details result passed in, e.g. by retrieve_yelp_info_by_alias, already has the hours)
+        yelp_fusion_api_business_details = business if business and "hours" in business else None
+        if not yelp_fusion_api_business_details:
+            print("CALLING YELP FUSION API FOR BUSINESS DETAILS")
+            try:
+                yf_url = f"https://api.yelp.com/v3/businesses/{business['id']}"
+                api_call = yelp_get(yf_url, headers={"Authorization": "Bearer "+YELP_FUSION_KEY})
 
-            attempts = 0
-            while attempts < 3:
-                if api_call.status_code == 200:
-                    yelp_fusion_api_business_details = api_call.json()
-                    break
-                else:
-                    print("API (2) STATUS CODE", api_call.status_code)
-                    attempts += 1
-        except Exception as e:
-            print("ERROR CALLING FUSION (2):", e)
+                attempts = 0
+                while attempts < 3:
+                    if api_call.status_code == 200:
+                        yelp_fusion_api_business_details = api_call.json()
+                        break
+                    else:
+                        print("API (2) STATUS CODE", api_call.status_code)
+                        attempts += 1
+            except Exception as e:
+                print("ERROR CALLING FUSION (2):", e)
         
         # Store hours
         if yelp_fusion_api_business_details:
             try: business_data["hours"] = yelp_fusion_api_business_details["hours"]
             except Exception as e: print("ERROR GETTING HOURS FROM API", e)
-            try: business_data["is_open_now"] = yelp_fusion_api_business_details["hours"][0]["is_open_now"]
+            try:
+                business_data["is_open_now"] = yelp_fusion_api_business_details["hours"][0]["is_open_now"]
+                business_data["fetched_at"] = time.time()
             except Exception as e: print("ERROR GETTING OPEN STATUS FROM API", e)
 
         # Dump business_data JSON object
@@ -245,22 +336,20 @@ def retrieve_yelp_info(name: str, location: str, web_app: bool = False):
     return business_data
 
 
-def format_business_data(business_data: dict, web_app: bool = False) -> str:
+def format_business_data(business_data: dict, web_app: bool = False, preamble: bool = True, open_now: bool = True) -> str:
     """
     Formats business_data into a readable text file for training LangChain/ChatGPT.
+        With preamble=False the QuickYelp instructions are left out of the indexed text,
+        they are sent once in the chain's system prompt instead (see context_packing.py).
+        With open_now=False the (quickly stale) open/closed status is left out, e.g. for indexes cached for a day.
     """
     # Provide context for chatbot
-    bg_context = "You are QuickYelp, a chatbot which is able to answer questions about a given Yelp business. \n"+ \
-        "The content provided is the background context/information of the business/restaurant that can be found on the Yelp page. \n"+ \
-        "Beware: some content is formatted in JSON format.\n\n"
-    reviews = "You are QuickYelp, a chatbot which is able to answer questions about a given Yelp business. \n"+ \
-        "The content provided is the reviews of the business/restaurant from the experience of Yelp users who have visited the service.\n" + \
-        "Think of ratings from 4-5 stars as positive, and 1-3 stars as negative.\n\n"
+    bg_context = INFO_PREAMBLE if preamble else ""
+    reviews = REVIEW_PREAMBLE if preamble else ""
 
     sections = ["name", "history", "specialties", "location", "phone", "categories",
                 "overall_rating", "price_range" , "hours", "transactions"]
     special = {"specialties", "categories"}
-    bg_context += "You are provided the following information about the business:\n"
 
     # Format business_data sections
     for section in sections:
@@ -288,9 +377,9 @@ def format_business_data(business_data: dict, web_app: bool = False) -> str:
         if business_data[section]:
             if section == "hours":
                 content += f": {business_data[section]} (formatted in JSON)."
-                if business_data["is_open_now"]:
+                if open_now and business_data["is_open_now"]:
                     content += "The business is open right now."
-                else:
+                elif open_now:
                     content += "The business is not open right now."
             else:
                 content += f": \"{business_data[section]}\"."
@@ -323,13 +412,61 @@ def format_business_data(business_data: dict, web_app: bool = False) -> str:
         return bg_context, reviews
 
 
+def review_id(rating: str, review: str) -> str:
+    """
+    Stable identifier for a review, derived from its rating and text.
+    """
+    return hashlib.sha1(f"{rating}:{review}".encode()).hexdigest()[:16]
+
+
+def review_documents(business_data: dict):
+    """
+    Splits business_data reviews into one indexable text per review.
+        Returns (texts, metadatas, ids) so reviews can be diffed and appended individually.
+    """
+    texts, metadatas, ids = [], [], []
+    for rating in ['5', '4', '3', '2', '1']:
+        for review in business_data["reviews"].get(rating, []):
+            if review_id(rating, review) in ids:
+                continue
+            texts.append(f'{rating} Stars ({"Positive" if int(rating) > 3 else "Negative"}) - Review: {review}')
+            metadatas.append({"rating": rating})
+            ids.append(review_id(rating, review))
+
+    if not texts:
+        texts, metadatas, ids = ["The reviews are not provided at all. This is a MAJOR error!"], [{}], ["no-reviews"]
+    return texts, metadatas, ids
+
+
+def build_info_index(business_data: dict, embeddings=None):
+    """
+    Index the formatted business information (same splitting as TextLoader.load_and_split).
+    """
+    business_info, _ = format_business_data(business_data, web_app=True, preamble=False, open_now=False)
+    info_docs = RecursiveCharacterTextSplitter().create_documents([business_info])
+    return get_vectorstore_cls().from_documents(info_docs, embedding=embeddings or get_embeddings())
+
+
+def build_review_index(business_data: dict, embeddings=None):
+    """
+    Index the reviews, one document per review.
+    """
+    texts, metadatas, ids = review_documents(business_data)
+    return get_vectorstore_cls().from_texts(texts, embeddings or get_embeddings(), metadatas=metadatas, ids=ids)
+
+
+YELP_URL_PATTERNS = [
+    re.compile(r'^https?://(?:www\.)?yelp\.com/biz/[\w-]+(?:-\w+)?(?:\?[\w=&-]*)?$'),
+    re.compile(r'^https://m\.yelp\.com/biz/[\w-]+(?:-\w+)?(?:\?.*)?$'),
+    re.compile(r'^https://yelp\.to/[a-zA-Z0-9]+$')
+]
+
+
 def validate_url(url):
     """
     Helper function to validate Yelp URL. Accepts mobile, yelp.to, and desktop links.
     """
-    return re.match(r'^https?://(?:www\.)?yelp\.com/biz/[\w-]+(?:-\w+)?(?:\?[\w=&-]*)?$', url) or \
-        re.match(r'^https://m\.yelp\.com/biz/[\w-]+(?:-\w+)?(?:\?.*)?$', url) or \
-        re.match(r'^https://yelp\.to/[a-zA-Z0-9]+$', url)
+    return any(pattern.match(url) for pattern in YELP_URL_PATTERNS)
 
 
 def run_query(qa, query):
@@ -345,6 +482,144 @@ def run_query(qa, query):
     return res
 
 
+def unified_messages(info_db, review_db, query, history=None) -> list:
+    """
+    Chat messages for a unified answer: retrieved context from both indexes labelled by source,
+    then the previous (query, reply) turns, then the query.
+    """
+    history = history or []
+    # Follow-ups ("what about the prices?") retrieve better alongside the previous question
+    retrieval_query = f"{history[-1][0]} {query}" if history else query
+    info_docs, info_tokens, _ = retrieve_packed(info_db, retrieval_query, CONTEXT_TOKEN_BUDGET // 2)
+    review_docs, _, _ = retrieve_packed(review_db, retrieval_query, CONTEXT_TOKEN_BUDGET - info_tokens)
+
+    context = [f"[Info {i+1}] {doc.page_content}" for i, doc in enumerate(info_docs)] + \
+              [f"[Review {i+1}] {doc.page_content}" for i, doc in enumerate(review_docs)]
+    messages = [SystemMessage(content=UNIFIED_PREAMBLE + "----------------\n" + '\n\n'.join(context))]
+    for previous_query, previous_reply in history:
+        messages += [HumanMessage(content=previous_query), AIMessage(content=previous_reply)]
+    messages.append(HumanMessage(content=query))
+    print(f"UNIFIED CONTEXT: {len(info_docs)} INFO + {len(review_docs)} REVIEW CHUNKS, "
+          f"{sum(count_tokens(message.content) for message in messages)} PROMPT TOKENS")
+    return messages
+
+
+def run_unified_query(info_db, review_db, query, history=None):
+    """
+    Answer the query with a single LLM call over both indexes.
+        Retrieval runs once; only the LLM call is routed (and hedged), so fallbacks reuse the same prompt.
+        history is a list of previous (query, reply) turns, used for follow-up questions.
+    """
+    messages = unified_messages(info_db, review_db, query, history)
+
+    def predict(model):
+        print('-'*50)
+        print("QUERY:", query)
+        print(f"CALLING {model} (UNIFIED)")
+        res = chat_llm(model).predict_messages(messages).content
+        print("RECEIVED ANSWER:", res[:50]+'...')
+        print('-'*50)
+        return res
+
+    return run_routed(predict, query, "unified")
+
+
+def _get_chain(chains: dict, db, preamble: str, model: str):
+    """
+    QA chain for (db, model), built once and cached in chains.
+    """
+    key = (id(db), model)
+    if key not in chains:
+        chains[key] = build_qa_chain(chat_llm(model), db, preamble)
+    return chains[key]
+
+
+def answer_question(info_db, review_db, query, chains: dict = None):
+    """
+    Answer one question in the configured ANSWER_MODE.
+        In legacy mode the info and review chains run concurrently, then are merged.
+    """
+    if ANSWER_MODE == "unified":
+        return run_unified_query(info_db, review_db, query)
+
+    chains = {} if chains is None else chains
+    info_qa = lambda model: run_query(_get_chain(chains, info_db, INFO_PREAMBLE, model), query)
+    review_qa = lambda model: run_query(_get_chain(chains, review_db, REVIEW_PREAMBLE, model), query)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        res_1 = pool.submit(run_routed, info_qa, query, "info")
+        res_2 = pool.submit(run_routed, review_qa, query, "reviews")
+        return merge_queries(res_1.result(), res_2.result(), query)
+
+
+def run_batch(input_path: str, output_path: str, workers: int = 4):
+    """
+    Non-interactive batch mode for offline evaluation.
+        Each input line is {"name": ..., "location": ..., "questions": [...]} (or "alias" instead of name/location).
+        Indexes and chains are built once per business, questions run concurrently on `workers` threads,
+        and one JSON result per question is streamed to output_path as soon as it is answered.
+    """
+    write_lock = threading.Lock()
+    batch_start = time.perf_counter()
+
+    with open(input_path, 'r') as f_in, open(output_path, 'w') as f_out, ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def emit(result):
+            with write_lock:
+                f_out.write(json.dumps(result)+'\n')
+                f_out.flush()
+
+        def ask(business, info_db, review_db, chains, question):
+            start = time.perf_counter()
+            result = {"business": business, "question": question}
+            try:
+                result["answer"] = answer_question(info_db, review_db, question, chains)
+            except Exception as e:
+                result["error"] = repr(e)
+            result["seconds"] = round(time.perf_counter()-start, 3)
+            emit(result)
+
+        futures = []
+        for line_number, line in enumerate(f_in, 1):
+            if not line.strip():
+                continue
+            try:
+                batch_request = json.loads(line)
+                if not isinstance(batch_request, dict):
+                    raise ValueError("expected a JSON object")
+                questions = batch_request.get("questions", [])
+                if not isinstance(questions, list) or not all(isinstance(question, str) for question in questions):
+                    raise ValueError("\"questions\" must be a list of strings")
+            except ValueError as e:
+                emit({"line": line_number, "error": f"Malformed batch line: {e!r}"})
+                continue
+            alias = batch_request.get("alias")
+            business = alias or f"{batch_request.get('name')} ({batch_request.get('location')})"
+
+            # Build each business once; its questions run while the next business is built
+            start = time.perf_counter()
+            try:
+                if alias:
+                    business_data = retrieve_yelp_info_by_alias(alias, web_app=True)
+                else:
+                    business_data = retrieve_yelp_info(batch_request["name"], batch_request["location"], web_app=True)
+                if not business_data["name"]:
+                    raise Exception("No matching Yelp business found")
+                info_db, review_db = build_info_index(business_data), build_review_index(business_data)
+            except Exception as e:
+                emit({"business": business, "error": repr(e), "seconds": round(time.perf_counter()-start, 3)})
+                continue
+            print(f"BUILT {business} IN {time.perf_counter()-start:.2f}s")
+
+            chains = {}
+            for question in questions:
+                futures.append(pool.submit(ask, business, info_db, review_db, chains, question))
+
+        for future in futures:
+            future.result()
+
+    print(f"BATCH DONE: {len(futures)} QUESTIONS IN {time.perf_counter()-batch_start:.2f} SECONDS -> {output_path}")
+
+
 def merge_queries_GPT(res_1, res_2, query):
     """
     Merge the two LangChain results.
@@ -358,13 +633,21 @@ def merge_queries_GPT(res_1, res_2, query):
                    "If both replies do not know the answer, please say either message."
     }
 
+    # Rarely used, so openai is only imported here
+    import openai
+    import openai.api_requestor
+    openai.api_key = os.environ.get('OPENAI_API_KEY')
+    openai.api_requestor.MAX_CONNECTION_RETRIES = MODEL_MAX_RETRIES
+
     print('-'*50)
     print("CALLING OPENAI API TO MERGE")
-    llm = openai.ChatCompletion.create(
-        model="gpt-4", 
+    llm = run_routed(lambda model: openai.ChatCompletion.create(
+        model=model, 
         temperature=0, 
-        messages=[merge_request]
-    )
+        messages=[merge_request],
+        request_timeout=LATENCY_BUDGET,
+        timeout=LATENCY_BUDGET # Bounds openai's own "model warming up" retry loop
+    ), query, "merge")
     print("RECEIVED OPENAI MERGED MESSAGE")
     print("RESULT:", llm.choices[0].message.content[:50]+'...')
     print('-'*50)
@@ -394,7 +677,20 @@ if __name__ == "__main__":
     https://www.yelp.com/biz/kikis-chicken-place-sacramento-15?page_src=related_bizes
     https://m.yelp.com/biz/world-wrapps-san-ramon?primary_source=biz_details&secondary_source=nav_bar&share_id=4C78CAD6-084F-41A2-A4CE-D42CCE3A0133&uid=q-o2wstFFth7bN91gMDSkA&utm_source=ishare
     https://yelp.to/gMUOLofNOg
+
+    Batch mode: python shell.py --batch questions.jsonl [--output results.jsonl] [--workers 4]
     """
+    import argparse
+    parser = argparse.ArgumentParser(description="QuickYelp shell")
+    parser.add_argument("--batch", help="JSONL file of {name, location | alias, questions} to answer non-interactively")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Where batch results are streamed (JSONL)")
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered concurrently in batch mode")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, args.output, args.workers)
+        sys.exit(0)
+
     if not DEBUGGING:
         print('-'*100)
         print("QuickYelp - AI Yelp Review ChatBot")
@@ -449,36 +745,30 @@ if __name__ == "__main__":
         print('-' * 100)
     
     # Format business_data
-    format_business_data(business_data)
+    format_business_data(business_data, preamble=False)
     with open("business_information.txt", 'r') as f:
         business_information = f.read()
     with open("business_reviews.txt", 'r') as f:
         business_reviews = f.read()
 
-    # Create FAISS database
+    # Create vector index
+    from langchain.document_loaders import TextLoader
     info_loader = TextLoader("business_information.txt")
     review_loader = TextLoader("business_reviews.txt")
     info_docs = info_loader.load_and_split()
     review_docs = review_loader.load_and_split()
-    info_db = FAISS.from_documents(info_docs, embedding=OpenAIEmbeddings())
-    review_db = FAISS.from_documents(review_docs, embedding=OpenAIEmbeddings())
+    info_db = get_vectorstore_cls().from_documents(info_docs, embedding=get_embeddings())
+    review_db = get_vectorstore_cls().from_documents(review_docs, embedding=get_embeddings())
 
-    # Initiate ChatBot
+    # Initiate ChatBot (chains are built once and reused across questions)
+    chains = {}
     while True:
         query = input("Ask a question about the business (Q to quit): ")
         if query == 'Q': break
 
-        # Query using LangChain's RetrievalQA
-        start = time.perf_counter()
-        info_qa = RetrievalQA.from_chain_type(llm=ChatOpenAI(temperature=0), chain_type="stuff", retriever=info_db.as_retriever())
-        review_qa = RetrievalQA.from_chain_type(llm=ChatOpenAI(temperature=0), chain_type="stuff", retriever=review_db.as_retriever())
-        end = time.perf_counter()
-        print("Elapsed time to load db: ", end-start)
-
-        # Asynchronously call info and review chains
+        # Asynchronously call info and review chains, on the models chosen by model_router
         start = time.perf_counter()
-        res_1, res_2 = run_query(info_qa, query), run_query(review_qa, query)
-        res = merge_queries(res_1, res_2, query)
+        res = answer_question(info_db, review_db, query, chains)
         end = time.perf_counter()
         print("Elapsed time to query: ", end-start)
         print(res)
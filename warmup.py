@@ -0,0 +1,101 @@
+# warmup.py - Julian Zulfikar
+# --------------------------------------
+# Prebuild business data and indexes for a list of businesses (run at deploy time).
+#
+# Usage: python warmup.py warmup_businesses.txt [--workers 4] [--rate 2]
+#   Each line is a Yelp business URL, a Yelp alias, or "name<TAB>location".
+#   Blank lines and lines starting with '#' are ignored.
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+from urllib.parse import urlparse
+
+import redis
+
+import shell
+from shell import retrieve_yelp_info, retrieve_yelp_info_by_alias, RateLimiter
+from index_store import store_business
+
+
+def connect_redis():
+    """
+    Connect to the same Redis as app.py: REDIS_URL in production, localhost otherwise.
+    """
+    if os.environ.get("REDIS_URL"):
+        redis_url = urlparse(os.environ.get("REDIS_URL"))
+        return redis.Redis(host=redis_url.hostname, port=redis_url.port, password=redis_url.password, ssl=True, ssl_cert_reqs=None)
+    return redis.StrictRedis(host='127.0.0.1', port=6379, db=0)
+
+
+def read_businesses(path: str) -> list:
+    """
+    Parse the input file into a list of aliases (str) and (name, location) pairs.
+    """
+    businesses = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '\t' in line:
+                name, location = line.split('\t', 1)
+                businesses.append((name.strip(), location.strip()))
+            elif "/biz/" in line:
+                businesses.append(line.split("/biz/")[1].split('?')[0].strip('/'))
+            else:
+                businesses.append(line)
+    return businesses
+
+
+def warm(redis_client, business) -> tuple:
+    """
+    Retrieve, persist and index one business. Returns (key, elapsed seconds).
+    """
+    start = perf_counter()
+    if isinstance(business, tuple):
+        business_data = retrieve_yelp_info(*business, web_app=True)
+    else:
+        business_data = retrieve_yelp_info_by_alias(business, web_app=True)
+
+    if not business_data["name"]:
+        raise Exception("No matching Yelp business found")
+    key, _, _ = store_business(redis_client, business_data)
+    return key, perf_counter()-start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prebuild QuickYelp business data and indexes.")
+    parser.add_argument("path", help="File of Yelp URLs, aliases or name<TAB>location pairs")
+    parser.add_argument("--workers", type=int, default=4, help="Businesses to build concurrently")
+    parser.add_argument("--rate", type=float, default=2.0, help="Maximum requests per second to Yelp (all workers)")
+    args = parser.parse_args()
+
+    businesses = read_businesses(args.path)
+    shell.YELP_RATE_LIMITER = RateLimiter(args.rate)
+    redis_client = connect_redis()
+
+    print('-'*100)
+    print(f"WARMING {len(businesses)} BUSINESSES ({args.workers} WORKERS, {args.rate} REQ/S)")
+    print('-'*100)
+
+    start = perf_counter()
+    failures = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(warm, redis_client, business): business for business in businesses}
+        for future in as_completed(futures):
+            business = futures[future]
+            try:
+                key, elapsed = future.result()
+                print(f"DONE   {key:<50} {elapsed:.2f}s")
+            except Exception as e:
+                failures.append(business)
+                print(f"FAILED {str(business):<50} {repr(e)}")
+
+    print('-'*100)
+    print(f"Warmed {len(businesses)-len(failures)}/{len(businesses)} businesses in {perf_counter()-start:.2f} seconds")
+    for business in failures:
+        print("FAILED:", business)
+    sys.exit(1 if failures else 0)